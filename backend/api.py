@@ -1,15 +1,22 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import os
+import re
 import time
 import asyncio
+import hashlib
+from email.utils import formatdate
+from urllib.parse import quote
 from typing import Optional, List
 from .job_manager import job_manager, JobStatus
 from .history import history_manager
 
 router = APIRouter()
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20 # 1 MB
+RANGE_HEADER_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
 class StartConfig(BaseModel):
     service_account_json: str
     cloudinary_cloud_name: str
@@ -50,29 +57,67 @@ async def get_history():
     return history_manager.get_all()
 
 async def log_generator():
-    """Generator for Server-Sent Events (SSE) that streams new logs."""
-    last_idx = 0
-    while True:
-        logs = list(job_manager.logs)
-        if len(logs) > last_idx:
-            new_logs = logs[last_idx:]
+    """Generator for Server-Sent Events (SSE) that streams new logs as they are added."""
+    listener = job_manager.subscribe_logs()
+    _, new_log_event = listener
+    seen_count = 0
+    try:
+        while True:
+            # Clear before reading so a log added in between still wakes us up
+            new_log_event.clear()
+            new_logs, seen_count = job_manager.logs_since(seen_count)
             for log in new_logs:
                 yield f"data: {log}\n\n"
-            last_idx = len(logs)
-        
-        if job_manager.status not in [JobStatus.RUNNING, JobStatus.IDLE] and last_idx >= len(logs):
-            # Keep open for a bit to ensure client gets final status update
-            # But eventually we might want to close or just wait
-            pass
-
-        await asyncio.sleep(0.5)
+            await new_log_event.wait()
+    finally:
+        job_manager.unsubscribe_logs(listener)
 
 @router.get("/logs/stream")
 async def stream_logs():
     return StreamingResponse(log_generator(), media_type="text/event-stream")
 
-@router.get("/download")
-async def download_results(filename: Optional[str] = Query(None)):
+def parse_range(range_header, file_size):
+    """
+    Returns (start, end) for a single "bytes=" range, or None to send the whole file.
+    Multi-range and malformed headers (including first-pos > last-pos) are
+    ignored and the whole file is sent, as RFC 9110 asks.
+    """
+    match = RANGE_HEADER_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        if end and int(end) < start:
+            return None
+        end = min(int(end), file_size - 1) if end else file_size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(file_size - int(end), 0)
+        end = file_size - 1
+
+    if start >= file_size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, end
+
+def iter_file_range(path, start, length):
+    """Streams `length` bytes of a file from `start` in DOWNLOAD_CHUNK_SIZE chunks."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+@router.api_route("/download", methods=["GET", "HEAD"])
+async def download_results(request: Request, filename: Optional[str] = Query(None)):
     target_file = filename if filename else 'books.json'
     
     # Security check: prevent directory traversal
@@ -81,5 +126,46 @@ async def download_results(filename: Optional[str] = Query(None)):
 
     if not os.path.exists(target_file):
         raise HTTPException(status_code=404, detail="File not found")
-        
-    return FileResponse(target_file, media_type='application/json', filename=target_file)
+
+    # Size is taken once up front. The validators change whenever the scanner
+    # appends records, so a resume against a newer file gets the whole file
+    # again (If-Range) instead of bytes spliced from two versions.
+    stat = os.stat(target_file)
+    file_size = stat.st_size
+    etag = '"' + hashlib.md5(f"{stat.st_mtime_ns}-{file_size}".encode()).hexdigest() + '"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    quoted_name = quote(target_file)
+    if quoted_name != target_file:
+        disposition = f"attachment; filename*=utf-8''{quoted_name}"
+    else:
+        disposition = f'attachment; filename="{target_file}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": disposition,
+        "ETag": etag,
+        "Last-Modified": last_modified,
+    }
+
+    range_header = request.headers.get("range", "")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in (etag, last_modified):
+        range_header = ""
+    byte_range = parse_range(range_header, file_size)
+    if byte_range is None:
+        status_code = 200
+        start, end = 0, file_size - 1
+    else:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type='application/json')
+    return StreamingResponse(
+        iter_file_range(target_file, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type='application/json'
+    )
@@ -1,10 +1,14 @@
 import json
 import os
-import time
+from collections import deque
 from datetime import datetime
 from threading import Lock
 
-HISTORY_FILE = 'scan_history.json'
+import orjson
+
+HISTORY_FILE = 'scan_history.jsonl'
+LEGACY_HISTORY_FILE = 'scan_history.json'
+MAX_HISTORY_ENTRIES = 100
 
 class HistoryManager:
     _instance = None
@@ -13,36 +17,26 @@ class HistoryManager:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(HistoryManager, cls).__new__(cls)
-            cls._instance.history = []
-            cls._instance.load()
+            cls._instance.migrate_legacy()
         return cls._instance
 
-    def load(self):
-        if not os.path.exists(HISTORY_FILE):
-            self.history = []
+    def migrate_legacy(self):
+        """Converts the old whole-list scan_history.json into the append-only JSONL file."""
+        if os.path.exists(HISTORY_FILE) or not os.path.exists(LEGACY_HISTORY_FILE):
             return
 
         try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            with open(LEGACY_HISTORY_FILE, 'r', encoding='utf-8') as f:
                 content = f.read()
-                if not content.strip():
-                    self.history = []
-                    return
-                self.history = json.loads(content)
-                # Ensure it's a list
-                if not isinstance(self.history, list):
-                    self.history = []
+            history = json.loads(content) if content.strip() else []
+            if not isinstance(history, list):
+                history = []
+            # Legacy file is newest-first, JSONL is appended oldest-first
+            with open(HISTORY_FILE, 'wb') as f:
+                for entry in reversed(history):
+                    f.write(orjson.dumps(entry) + b'\n')
         except Exception as e:
-            print(f"Error loading history: {e}")
-            self.history = []
-
-    def save(self):
-        with self._lock:
-            try:
-                with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(self.history, f, ensure_ascii=False, indent=4)
-            except Exception as e:
-                print(f"Error saving history: {e}")
+            print(f"Error migrating history: {e}")
 
     def add_entry(self, entry):
         # Entry structure:
@@ -56,14 +50,33 @@ class HistoryManager:
         #   "folder_name": "folder name"
         # }
         entry['timestamp'] = datetime.now().isoformat()
-        # Add to beginning of list
-        self.history.insert(0, entry)
-        # Limit history size (optional, say 100 entries)
-        if len(self.history) > 100:
-            self.history = self.history[:100]
-        self.save()
+        with self._lock:
+            try:
+                with open(HISTORY_FILE, 'ab') as f:
+                    f.write(orjson.dumps(entry) + b'\n')
+            except Exception as e:
+                print(f"Error saving history: {e}")
 
     def get_all(self):
-        return self.history
+        """Returns the last MAX_HISTORY_ENTRIES entries, newest first."""
+        if not os.path.exists(HISTORY_FILE):
+            return []
+
+        try:
+            with open(HISTORY_FILE, 'rb') as f:
+                lines = deque(f, maxlen=MAX_HISTORY_ENTRIES)
+        except Exception as e:
+            print(f"Error loading history: {e}")
+            return []
+
+        history = []
+        for line in reversed(lines):
+            if not line.strip():
+                continue
+            try:
+                history.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue # Skip a partially written line
+        return history
 
 history_manager = HistoryManager()
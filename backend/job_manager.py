@@ -1,3 +1,5 @@
+import asyncio
+import itertools
 import threading
 import time
 from collections import deque
@@ -14,10 +16,13 @@ class JobStatus(str, Enum):
 
 class JobManager:
     _instance = None
+    _progress_lock = threading.Lock()
+    _log_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(JobManager, cls).__new__(cls)
+            cls._instance.log_listeners = set()
             cls._instance.reset()
         return cls._instance
 
@@ -29,7 +34,9 @@ class JobManager:
             "errors": 0,
             "total_scanned_so_far": 0
         }
-        self.logs = deque(maxlen=1000) # Keep last 1000 logs
+        with self._log_lock:
+            self.logs = deque(maxlen=1000) # Keep last 1000 logs
+            self.log_count = 0 # Total lines added, including ones dropped from `logs`
         self.current_file = ""
         self.start_time = None
         self.end_time = None
@@ -40,13 +47,44 @@ class JobManager:
         self.folder_name = None
 
     def add_log(self, message):
-        self.logs.append(message)
+        with self._log_lock:
+            self.logs.append(message)
+            self.log_count += 1
+        # Wake up SSE streams; add_log is called from worker threads
+        for loop, event in list(self.log_listeners):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass # Loop already closed
+
+    def subscribe_logs(self):
+        """Returns a (loop, asyncio.Event) listener that is set whenever a log is added."""
+        listener = (asyncio.get_running_loop(), asyncio.Event())
+        self.log_listeners.add(listener)
+        return listener
+
+    def unsubscribe_logs(self, listener):
+        self.log_listeners.discard(listener)
+
+    def logs_since(self, seen_count):
+        """
+        Returns (new_logs, log_count) for a reader that has already seen
+        `seen_count` lines, copying only the new lines.
+        """
+        with self._log_lock:
+            if seen_count > self.log_count:
+                seen_count = 0 # Logs were reset since the last read
+            new_count = min(self.log_count - seen_count, len(self.logs))
+            new_logs = list(itertools.islice(self.logs, len(self.logs) - new_count, None))
+            return new_logs, self.log_count
 
     def update_progress(self, processed=0, skipped=0, errors=0):
-        self.counters["processed"] += processed
-        self.counters["skipped"] += skipped
-        self.counters["errors"] += errors
-        self.counters["total_scanned_so_far"] += (processed + skipped + errors)
+        # Called concurrently from the scanner's pipeline workers
+        with self._progress_lock:
+            self.counters["processed"] += processed
+            self.counters["skipped"] += skipped
+            self.counters["errors"] += errors
+            self.counters["total_scanned_so_far"] += (processed + skipped + errors)
 
     def start_job(self, config):
         if self.status == JobStatus.RUNNING:
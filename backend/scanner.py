@@ -8,13 +8,28 @@ import shutil
 import datetime
 import threading
 import re
+import queue
+import random
+import socket
+import functools
+import atexit
+import multiprocessing
+from collections import deque
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 # Third-party imports
+import orjson
 import fitz  # PyMuPDF
 import cloudinary
 import cloudinary.uploader
+import cloudinary.exceptions
+import httplib2
+import google_auth_httplib2
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 
@@ -23,17 +38,184 @@ from google.auth.transport.requests import Request
 # ==========================================
 # OUTPUT_FILE is now dynamic
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+PDF_MIME_TYPE = 'application/pdf'
+
+# Most textbooks download in one or two Range requests at this chunk size
+DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+HTTP_TIMEOUT_SECONDS = 120
+
+# Folders whose children are listed with a single OR-combined `in parents` query
+PARENTS_PER_QUERY = 30
+# From this many release-year folders on, PDFs are found with a single
+# Drive-wide query instead of per-folder queries
+TREE_WIDE_PDF_LISTING_MIN_FOLDERS = 200
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_REQUESTS = 100
+# Largest page Drive returns from files.list; fewer pages means fewer round-trips
+LIST_PAGE_SIZE = 1000
+
+# Drive allows 1000 queries per 100 s per user; stay just under it
+DRIVE_QUERIES_PER_PERIOD = 900
+DRIVE_QUOTA_PERIOD = 100
+
+# Retries for transient Drive / Cloudinary failures: a random wait of up to
+# 2s, 4s, 8s, ... (capped at RETRY_MAX_DELAY) between attempts, so workers
+# throttled together do not retry in lockstep
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Drive reports quota throttling as 403 with one of these reasons
+RETRY_403_REASONS = {'userRateLimitExceeded', 'rateLimitExceeded'}
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    httplib2.HttpLib2Error,
+    cloudinary.exceptions.GeneralError,
+    cloudinary.exceptions.RateLimited,
+)
+# The Cloudinary uploader raises its base Error for socket/urllib3 failures;
+# those are told apart from API errors (bad credentials, ...) by the message
+CLOUDINARY_TRANSIENT_MESSAGES = ("Socket error", "Unexpected error")
+# Non-JSON responses (e.g. an HTML 502/504 page from a proxy) are reported as
+# "Error parsing server response (<status>) ..."; retried on RETRY_STATUS_CODES
+CLOUDINARY_UNPARSED_RESPONSE_PATTERN = re.compile(r'Error parsing server response \((\d+)\)')
+
+# Thumbnails: render at half size, capped so the longer side stays within
+# THUMBNAIL_MAX_SIDE pixels (oversized scans and posters), and upload as JPEG
+THUMBNAIL_SCALE = 0.5
+THUMBNAIL_MAX_SIDE = 400
+THUMBNAIL_JPEG_QUALITY = 75
+
+# Folder skeleton cache (levels 0-4), reused for folders unchanged since the last run.
+# One file per service account, since each account sees a different part of Drive.
+FOLDER_CACHE_FILE = 'folder_cache_{}.json'
+FOLDER_CACHE_MAX_AGE_SECONDS = 24 * 60 * 60
+
+# Output records are written in batches of this size, or at least this often
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL_SECONDS = 30
+
+# Per-file pipeline: worker threads per stage and bounded hand-off queues.
+# Download and upload are network-bound and mostly wait on round-trips, so
+# they get more workers than there are cores; Drive calls are still paced
+# by drive_rate_limiter.
+DOWNLOAD_WORKERS = 8
+# One render process per usable core, up to MAX_RENDER_WORKERS: each render holds
+# a full PDF twice (parent buffer plus the copy pickled to the child process).
+# sched_getaffinity respects the container's cpuset where os.cpu_count()
+# reports every host core.
+MAX_RENDER_WORKERS = 8
+RENDER_WORKERS = min(
+    len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1),
+    MAX_RENDER_WORKERS
+)
+UPLOAD_WORKERS = 8
+STAGE_QUEUE_SIZE = 8
+RENDER_QUEUE_SIZE = 4
+# Downloaded PDFs the pipeline holds at once, whether downloading, queued for
+# render or rendering; a download waits for a free slot. Peak memory is about
+# MAX_PDFS_IN_MEMORY + RENDER_WORKERS full PDFs, counting the copy each busy
+# render process receives.
+MAX_PDFS_IN_MEMORY = 8
 
 # ==========================================
 # HELPER FUNCTIONS
 # ==========================================
 
+_append_lock = threading.Lock()
+DRIVE_FILE_ID_PATTERN = re.compile(r'"drive_file_id":\s*"([^"\\]+)"')
+
 def log_message(log_callback, message, level="INFO"):
     """Emits a log message to the callback."""
     if log_callback:
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         log_callback(f"[{timestamp}] [{level}] {message}")
 
+def _http_error_reasons(exc):
+    """Returns the `reason` values from a Drive HttpError's JSON body."""
+    try:
+        error = orjson.loads(exc.content).get('error', {})
+        return {detail.get('reason') for detail in error.get('errors', [])}
+    except (ValueError, TypeError, AttributeError):
+        return set()
+
+def is_transient_error(exc):
+    """True for errors worth retrying: throttling, 5xx responses and network failures."""
+    if isinstance(exc, HttpError):
+        if exc.resp.status == 403:
+            return bool(_http_error_reasons(exc) & RETRY_403_REASONS)
+        return exc.resp.status in RETRY_STATUS_CODES
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    if isinstance(exc, cloudinary.exceptions.Error):
+        message = str(exc)
+        if message.startswith(CLOUDINARY_TRANSIENT_MESSAGES):
+            return True
+        match = CLOUDINARY_UNPARSED_RESPONSE_PATTERN.match(message)
+        return bool(match) and int(match.group(1)) in RETRY_STATUS_CODES
+    return False
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY):
+    """Full-jitter exponential backoff: a random delay up to base_delay * 2 ** attempt."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, base_delay * 2 ** attempt))
+
+def retry(max_attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """
+    Decorator that retries a call on transient errors, sleeping
+    backoff_delay(attempt) seconds between attempts.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc:
+                    if attempt + 1 >= max_attempts or not is_transient_error(exc):
+                        raise
+                    time.sleep(backoff_delay(attempt, base_delay))
+        return wrapper
+    return decorator
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `calls` acquisitions per `period`
+    seconds, in bursts of up to `calls`.
+    """
+
+    def __init__(self, calls, period):
+        self.capacity = calls
+        self.rate = calls / period
+        self.tokens = float(calls)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+drive_rate_limiter = RateLimiter(DRIVE_QUERIES_PER_PERIOD, DRIVE_QUOTA_PERIOD)
+
+@retry()
+def execute_request(request, calls=1):
+    """
+    Executes a Drive API request, or a batch holding `calls` requests,
+    within the Drive quota and retrying transient failures.
+    """
+    drive_rate_limiter.acquire(calls)
+    return request.execute()
+
 def sanitize_filename(name):
     """Sanitizes a string to be safe for filenames."""
     # Remove invalid characters
@@ -43,337 +225,737 @@ def sanitize_filename(name):
     return name or "scan_output"
 
 def load_processed_ids(output_file):
-    """Reads the existing JSON file and returns a set of processed drive_file_ids."""
+    """
+    Streams the existing JSON file and returns a set of processed drive_file_ids.
+    Only the "drive_file_id" values are pulled out, the records are never parsed.
+    Every match on a line is taken, so minified or re-saved files (many records
+    per line) load as fully as the pretty-printed ones append_records writes.
+    """
     if not os.path.exists(output_file):
         return set()
     
     processed_ids = set()
     try:
         with open(output_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                for item in data:
-                    if 'drive_file_id' in item:
-                        processed_ids.add(item['drive_file_id'])
-    except json.JSONDecodeError:
-        pass # Assuming empty or starting fresh
+            for line in f:
+                processed_ids.update(DRIVE_FILE_ID_PATTERN.findall(line))
     except Exception as e:
         pass # Log error via callback if possible, but here we just fail safe
     
     return processed_ids
 
-def append_record(record, output_file):
+def append_records(records, output_file):
     """
-    Appends a single record to the JSON array in the output file.
+    Appends records to the JSON array in the output file in a single write.
+    The file is kept ending in "\n]", so appending overwrites that tail with
+    ",\n<records>\n]" instead of rewriting or scanning the file. Safe to call
+    from several threads.
     """
-    json_record = json.dumps(record, ensure_ascii=False, indent=4)
+    json_record = b",\n".join(orjson.dumps(record, option=orjson.OPT_INDENT_2) for record in records)
     
-    try:
-        # Check if file exists and has content
-        file_exists = os.path.exists(output_file) and os.path.getsize(output_file) > 0
-        
-        if not file_exists:
-            # Create new file
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"[\n{json_record}\n]")
-        else:
-            # Append to existing file
-            with open(output_file, 'rb+') as f:
-                f.seek(0, os.SEEK_END)
-                pos = f.tell() - 1
-                while pos >= 0:
-                    f.seek(pos)
-                    char = f.read(1)
-                    if char == b']':
-                        f.seek(pos)
-                        full_entry = f",\n{json_record}\n]"
-                        f.write(full_entry.encode('utf-8'))
-                        break
-                    pos -= 1
-    except Exception as e:
-        print(f"Error appending record: {e}") # Fallback
+    with _append_lock:
+        try:
+            # Check if file exists and has content
+            file_exists = os.path.exists(output_file) and os.path.getsize(output_file) > 0
+            
+            if not file_exists:
+                # Create new file
+                with open(output_file, 'wb') as f:
+                    f.write(b"[\n" + json_record + b"\n]")
+            else:
+                # Append to existing file
+                with open(output_file, 'rb+') as f:
+                    size = f.seek(0, os.SEEK_END)
+                    f.seek(max(size - 64, 0))
+                    tail = f.read()
+                    bracket = tail.rfind(b']')
+                    if bracket < 0:
+                        raise ValueError(f"{output_file} is not a JSON array")
+                    # Overwrite the "\n]" tail (or a bare "]" in files written elsewhere)
+                    if tail[bracket - 1:bracket] == b"\n":
+                        bracket -= 1
+                    f.seek(size - len(tail) + bracket)
+                    f.write(b",\n" + json_record + b"\n]")
+                    f.truncate()
+        except Exception as e:
+            print(f"Error appending records: {e}") # Fallback
+
+class RecordWriter:
+    """
+    Buffers output records and appends them in batches: once
+    FLUSH_BATCH_SIZE records are pending, every FLUSH_INTERVAL_SECONDS, and
+    on close (or interpreter exit). IDs join `processed_ids` once flushed.
+    """
+
+    def __init__(self, output_file, processed_ids):
+        self.output_file = output_file
+        self.processed_ids = processed_ids
+        self.pending = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+        self.timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.timer.start()
+        atexit.register(self.flush)
+
+    def add(self, record):
+        with self.lock:
+            self.pending.append(record)
+            if len(self.pending) < FLUSH_BATCH_SIZE:
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            records, self.pending = self.pending, []
+        if records:
+            append_records(records, self.output_file)
+            self.processed_ids.update(record['drive_file_id'] for record in records)
+
+    def close(self):
+        self.closed.set()
+        self.timer.join()
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def _flush_periodically(self):
+        while not self.closed.wait(FLUSH_INTERVAL_SECONDS):
+            self.flush()
 
 # ==========================================
 # MAIN SCANNING LOGIC
 # ==========================================
 
-def get_drive_service(service_account_json):
+_thread_local = threading.local()
+
+def get_credentials(service_account_json):
     try:
         service_account_info = json.loads(service_account_json)
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON in Service Account Key: {e}")
 
-    creds = service_account.Credentials.from_service_account_info(
+    return service_account.Credentials.from_service_account_info(
         service_account_info, scopes=SCOPES)
-    return build('drive', 'v3', credentials=creds)
 
+def get_drive_service(creds):
+    """
+    Returns the calling thread's Drive service, building it on first use.
+    httplib2 transports are not thread-safe, so every thread gets its own;
+    the credentials (and their access token) are shared between them.
+    """
+    cached = getattr(_thread_local, 'drive_service', None)
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+
+    # Large download chunks need more than httplib2's default socket timeout
+    http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+    service = build('drive', 'v3', http=http, cache_discovery=False)
+    _thread_local.drive_service = (creds, service)
+    return service
+
+@retry()
 def download_file(service, file_id, file_name):
+    """Downloads a Drive file into memory and returns its bytes."""
     request = service.files().get_media(fileId=file_id)
-    temp_path = f"temp_{file_id}.pdf"
+    fh = io.BytesIO()
     
-    with io.FileIO(temp_path, 'wb') as fh:
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-    return temp_path
-
-def process_pdf(pdf_path, file_id, drive_file_name, log_callback):
-    if not os.path.exists(pdf_path):
-        return None
+    downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+    done = False
+    while done is False:
+        drive_rate_limiter.acquire()
+        status, done = downloader.next_chunk()
+    return fh.getvalue()
 
+def _render_thumbnail(pdf_bytes):
+    """
+    Renders the thumbnail page of a PDF and returns (jpeg_bytes, page_count).
+    Runs in a worker process: PyMuPDF holds the GIL while rendering.
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     try:
-        size_bytes = os.path.getsize(pdf_path)
-        file_size_mb = int(round(size_bytes / (1024 * 1024)))
-        
-        doc = fitz.open(pdf_path)
         page_count = doc.page_count
-        
+
         target_page_index = 1 if page_count >= 2 else 0
         page = doc.load_page(target_page_index)
-        pix = page.get_pixmap()
-        
-        temp_img_path = f"temp_{file_id}.png"
-        pix.save(temp_img_path)
+        bounds = page.bound()
+        scale = min(THUMBNAIL_SCALE, THUMBNAIL_MAX_SIDE / max(bounds.width, bounds.height, 1))
+        # Downscaled RGB without alpha: at most a quarter of the pixels, 3 bytes each.
+        # Annotations (highlights, form fields) are skipped, they only add noise
+        # to a cover thumbnail.
+        pix = page.get_pixmap(
+            matrix=fitz.Matrix(scale, scale),
+            clip=bounds,
+            alpha=False,
+            annots=False,
+            colorspace=fitz.csRGB
+        )
+        image_bytes = pix.tobytes("jpeg", jpg_quality=THUMBNAIL_JPEG_QUALITY)
+    finally:
         doc.close()
-        
-        log_message(log_callback, f"Uploading thumbnail for {drive_file_name}...", "INFO")
-        
-        upload_result = cloudinary.uploader.upload(
-            temp_img_path, 
-            public_id=file_id, 
-            folder="pdf_thumbnails"
+
+    return image_bytes, page_count
+
+@retry()
+def upload_thumbnail(image_bytes, file_id):
+    """Uploads thumbnail bytes to Cloudinary and returns the secure URL."""
+    upload_result = cloudinary.uploader.upload(
+        io.BytesIO(image_bytes), 
+        public_id=file_id, 
+        folder="pdf_thumbnails",
+        resource_type="image"
+    )
+    return upload_result.get('secure_url')
+
+# ==========================================
+# FILE PIPELINE
+# ==========================================
+
+class FilePipeline:
+    """
+    Overlaps Drive download, thumbnail rendering and Cloudinary upload.
+
+    Each stage runs on its own thread pool and hands work to the next one
+    through a bounded queue, so the upload of file N overlaps the render of
+    file N+1 and the download of file N+2. Finished records go to a
+    RecordWriter, which adds them to `processed_ids` as they are flushed.
+
+    Files whose Drive md5Checksum matches one already finished in this run
+    (the same book shared under another ID) reuse its thumbnail and metadata
+    without being downloaded, rendered or uploaded again.
+    """
+
+    def __init__(self, creds, processed_ids, output_file, log_callback, progress_callback, stop_event):
+        self.creds = creds
+        self.processed_ids = processed_ids
+        self.writer = RecordWriter(output_file, processed_ids)
+        self.log_callback = log_callback
+        self.progress_callback = progress_callback
+        self.stop_event = stop_event
+
+        self.queued_ids = set()
+        self.meta_by_checksum = {}
+        self.pdf_slots = threading.Semaphore(MAX_PDFS_IN_MEMORY)
+
+        # Unbounded: jobs here are only IDs and names, and submit() must not
+        # block the listing that feeds it
+        self.download_queue = queue.Queue()
+        # LIFO so the render stage takes the most recently downloaded PDF
+        # while its buffer is still warm in memory
+        self.render_queue = queue.LifoQueue(maxsize=RENDER_QUEUE_SIZE)
+        self.upload_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+
+        self.render_pool = self._new_render_pool()
+        self.render_pool_lock = threading.Lock()
+
+        self.stages = []
+        for name, workers, worker_fn, stage_queue in (
+            ("download", DOWNLOAD_WORKERS, self._download_worker, self.download_queue),
+            ("render", RENDER_WORKERS, self._render_worker, self.render_queue),
+            ("upload", UPLOAD_WORKERS, self._upload_worker, self.upload_queue),
+        ):
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+            futures = [pool.submit(worker_fn) for _ in range(workers)]
+            self.stages.append((pool, futures, stage_queue))
+
+    def submit(self, item_id, item_name, context, checksum=None):
+        """Queues a PDF for processing, skipping files that were already handled."""
+        if self.stop_event.is_set():
+            return
+        if item_id in self.processed_ids or item_id in self.queued_ids:
+            self.progress_callback(skipped=1)
+            return
+        self.queued_ids.add(item_id)
+        self.download_queue.put((item_id, item_name, context, checksum))
+
+    def close(self):
+        """Lets every queued file drain through the stages, then stops the workers."""
+        for pool, futures, stage_queue in self.stages:
+            # Wait for the queue to empty first: in a LIFO queue the sentinels
+            # would otherwise be taken before the jobs still waiting under them
+            stage_queue.join()
+            for _ in futures:
+                stage_queue.put(None)
+            wait(futures)
+            pool.shutdown()
+        self.render_pool.shutdown()
+        self.writer.close()
+
+    @staticmethod
+    def _new_render_pool():
+        # PyMuPDF does not release the GIL, so rendering runs in separate processes.
+        # 'spawn' avoids forking a process that already has running threads.
+        return ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
         )
-        secure_url = upload_result.get('secure_url')
-        
-        if os.path.exists(temp_img_path):
-            os.remove(temp_img_path)
-            
-        return {
-            "page_count": page_count,
-            "file_size_mb": file_size_mb,
-            "image_url": secure_url
+
+    def _render(self, item_name, pdf_bytes):
+        """
+        Renders a thumbnail in the process pool. If a render process died
+        (MuPDF crash, OOM kill) the pool is broken for good, so it is replaced
+        and every file caught in the break is retried in a single-use process of
+        its own: a PDF that crashes MuPDF then only takes itself down.
+        """
+        pool = self.render_pool
+        try:
+            return pool.submit(_render_thumbnail, pdf_bytes).result()
+        except BrokenProcessPool:
+            with self.render_pool_lock:
+                # Other render threads hit the same broken pool; rebuild it only once
+                if self.render_pool is pool:
+                    log_message(self.log_callback, f"A render process died (seen while rendering {item_name}), restarting the render pool", "WARNING")
+                    pool.shutdown(wait=False)
+                    self.render_pool = self._new_render_pool()
+
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as isolated_pool:
+            return isolated_pool.submit(_render_thumbnail, pdf_bytes).result()
+
+    @staticmethod
+    def _jobs(stage_queue):
+        """Yields jobs from a stage queue until the None sentinel, marking each done once handled."""
+        while True:
+            job = stage_queue.get()
+            try:
+                if job is None:
+                    return
+                yield job
+            finally:
+                stage_queue.task_done()
+                # Don't keep the last job (possibly a whole PDF) while waiting for the next
+                job = None
+
+    def _fail(self, item_name, exc):
+        log_message(self.log_callback, f"Error on file {item_name}: {exc}", "ERROR")
+        self.progress_callback(errors=1)
+
+    def _finish(self, item_id, item_name, context, meta):
+        record = {
+            "name": item_name,
+            "drive_file_id": item_id,
+            **context,
+            **meta
         }
-        
-    except Exception as e:
-        log_message(log_callback, f"Error processing PDF {drive_file_name}: {e}", "ERROR")
-        return None
+        self.writer.add(record)
+        log_message(self.log_callback, f"Finished: {item_name}", "SUCCESS")
+        self.progress_callback(processed=1)
 
-def process_level(service, parent_id, current_level, context_data, processed_ids, log_callback, progress_callback, stop_event, config, output_file):
-    if stop_event.is_set():
-        return
+    def _download_worker(self):
+        for job in self._jobs(self.download_queue):
+            if self.stop_event.is_set():
+                continue
 
-    # Levels: 0:Year -> 1:Term -> 2:Subject -> 3:Type -> 4:Release -> 5:Files
-    if current_level < 5:
-        query = f"'{parent_id}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    else:
-        query = f"'{parent_id}' in parents and mimeType = 'application/pdf' and trashed = false"
+            item_id, item_name, context, checksum = job
+            known_meta = self.meta_by_checksum.get(checksum) if checksum else None
+            if known_meta is not None:
+                log_message(self.log_callback, f"Reusing thumbnail of identical file for {item_name}", "INFO")
+                self._finish(item_id, item_name, context, dict(known_meta))
+                continue
 
-    page_token = None
-    while True:
-        if stop_event.is_set():
-            break
-            
+            # Released by the render stage once it is done with the PDF
+            self.pdf_slots.acquire()
+            log_message(self.log_callback, f"Processing: {item_name}", "INFO")
+            try:
+                service = get_drive_service(self.creds)
+                pdf_bytes = download_file(service, item_id, item_name)
+            except Exception as exc:
+                self.pdf_slots.release()
+                self._fail(item_name, exc)
+                continue
+            self.render_queue.put((item_id, item_name, context, checksum, pdf_bytes))
+            # Don't keep the PDF alive while waiting for the next download
+            pdf_bytes = None
+
+    def _render_worker(self):
+        for job in self._jobs(self.render_queue):
+            item_id, item_name, context, checksum, pdf_bytes = job
+            size_bytes = len(pdf_bytes)
+            try:
+                if self.stop_event.is_set():
+                    continue
+                image_bytes, page_count = self._render(item_name, pdf_bytes)
+            except Exception as exc:
+                log_message(self.log_callback, f"Error processing PDF {item_name}: {exc}", "ERROR")
+                self.progress_callback(errors=1)
+                continue
+            finally:
+                self.pdf_slots.release()
+
+            meta = {
+                "page_count": page_count,
+                "file_size_mb": int(round(size_bytes / (1024 * 1024)))
+            }
+            self.upload_queue.put((item_id, item_name, context, checksum, image_bytes, meta))
+
+    def _upload_worker(self):
+        for job in self._jobs(self.upload_queue):
+            if self.stop_event.is_set():
+                continue
+
+            item_id, item_name, context, checksum, image_bytes, meta = job
+            log_message(self.log_callback, f"Uploading thumbnail for {item_name}...", "INFO")
+            try:
+                meta["image_url"] = upload_thumbnail(image_bytes, item_id)
+            except Exception as exc:
+                self._fail(item_name, exc)
+                continue
+
+            if checksum:
+                self.meta_by_checksum[checksum] = meta
+            self._finish(item_id, item_name, context, meta)
+
+class FolderCache:
+    """
+    Remembers the sub-folders of each folder (levels 0-4) between runs.
+    Drive does not bump a folder's modifiedTime when something deep below it
+    changes, so instead refresh() runs one Drive-wide query for folders
+    modified since the last sync and forgets those folders, their current
+    parents and any cached folder still listing them as a child (the old
+    parent of a moved folder); everything else is served from the cache.
+    Since refresh() cannot see every change (trashing a folder does not always
+    bump modifiedTime), the whole cache is rebuilt once FOLDER_CACHE_MAX_AGE_SECONDS
+    have passed since it was first built, however often it has been refreshed.
+    Folder IDs must be real IDs, not the 'root' alias, which Drive never
+    reports in `parents`.
+    """
+
+    def __init__(self, client_email):
+        self.path = FOLDER_CACHE_FILE.format(sanitize_filename(client_email or "default"))
+        self.children = {}
+        self.synced_at = None
+        self.started_at = time.time()
+        self.created_at = self.started_at
         try:
-            results = service.files().list(
-                q=query,
-                pageSize=50,
-                fields="nextPageToken, files(id, name)",
-                pageToken=page_token
-            ).execute()
-            
-            items = results.get('files', [])
-            items.sort(key=lambda x: x['name'])
-            
-            # --- FLAT FOLDER MODE START ---
-            if current_level == 0 and not items and not page_token:
-                # Primary query returned no folders. Let's check for PDFs directly.
-                log_message(log_callback, "No folders found matching the structure. Checking for PDF files...", "INFO")
-                try:
-                    pdf_query = f"'{parent_id}' in parents and mimeType = 'application/pdf' and trashed = false"
-                    pdf_res = service.files().list(q=pdf_query, pageSize=100, fields="nextPageToken, files(id, name)").execute()
-                    pdf_items = pdf_res.get('files', [])
-                    
-                    if pdf_items:
-                        log_message(log_callback, f"FLAT FOLDER MODE: Found {len(pdf_items)} PDF files. Processing...", "SUCCESS")
-                        
-                        # Process PDFs directly without nested structure
-                        for pdf_item in pdf_items:
-                            if stop_event.is_set():
-                                break
-                                
-                            pdf_id = pdf_item['id']
-                            pdf_name = pdf_item['name']
-                            
-                            if pdf_id in processed_ids:
-                                progress_callback(skipped=1)
-                                continue
-                            
-                            log_message(log_callback, f"Processing: {pdf_name}", "INFO")
-                            
-                            try:
-                                temp_pdf_path = download_file(service, pdf_id, pdf_name)
-                                meta = process_pdf(temp_pdf_path, pdf_id, pdf_name, log_callback)
-                                
-                                if os.path.exists(temp_pdf_path):
-                                    os.remove(temp_pdf_path)
-                                
-                                if meta:
-                                    # Use metadata from config for flat folder
-                                    record = {
-                                        "name": pdf_name,
-                                        "drive_file_id": pdf_id,
-                                        "academic_year_id": config.get('academic_year_id', 'Direct'),
-                                        "term_id": config.get('term_id', 'Direct'),
-                                        "subject_id": config.get('subject_id', 'Direct'),
-                                        "book_type_id": config.get('book_type_id', 'Direct'),
-                                        "release_year": config.get('release_year', 'Direct'),
-                                        **meta
-                                    }
-                                    append_record(record, output_file)
-                                    processed_ids.add(pdf_id)
-                                    log_message(log_callback, f"Finished: {pdf_name}", "SUCCESS")
-                                    progress_callback(processed=1)
-                                else:
-                                    log_message(log_callback, f"Failed metadata extraction: {pdf_name}", "ERROR")
-                                    progress_callback(errors=1)
-                                    
-                            except Exception as exc:
-                                log_message(log_callback, f"Error on file {pdf_name}: {exc}", "ERROR")
-                                progress_callback(errors=1)
-                        
-                        # Check for more pages
-                        pdf_token = pdf_res.get('nextPageToken')
-                        while pdf_token:
-                            if stop_event.is_set():
-                                break
-                            pdf_res = service.files().list(
-                                q=pdf_query,
-                                pageSize=100,
-                                fields="nextPageToken, files(id, name)",
-                                pageToken=pdf_token
-                            ).execute()
-                            pdf_items = pdf_res.get('files', [])
-                            
-                            for pdf_item in pdf_items:
-                                if stop_event.is_set():
-                                    break
-                                pdf_id = pdf_item['id']
-                                pdf_name = pdf_item['name']
-                                
-                                if pdf_id in processed_ids:
-                                    progress_callback(skipped=1)
-                                    continue
-                                
-                                log_message(log_callback, f"Processing: {pdf_name}", "INFO")
-                                
-                                try:
-                                    temp_pdf_path = download_file(service, pdf_id, pdf_name)
-                                    meta = process_pdf(temp_pdf_path, pdf_id, pdf_name, log_callback)
-                                    
-                                    if os.path.exists(temp_pdf_path):
-                                        os.remove(temp_pdf_path)
-                                    
-                                    if meta:
-                                        record = {
-                                            "name": pdf_name,
-                                            "drive_file_id": pdf_id,
-                                            "academic_year_id": config.get('academic_year_id', 'Direct'),
-                                            "term_id": config.get('term_id', 'Direct'),
-                                            "subject_id": config.get('subject_id', 'Direct'),
-                                            "book_type_id": config.get('book_type_id', 'Direct'),
-                                            "release_year": config.get('release_year', 'Direct'),
-                                            **meta
-                                        }
-                                        append_record(record, output_file)
-                                        processed_ids.add(pdf_id)
-                                        log_message(log_callback, f"Finished: {pdf_name}", "SUCCESS")
-                                        progress_callback(processed=1)
-                                    else:
-                                        log_message(log_callback, f"Failed metadata extraction: {pdf_name}", "ERROR")
-                                        progress_callback(errors=1)
-                                        
-                                except Exception as exc:
-                                    log_message(log_callback, f"Error on file {pdf_name}: {exc}", "ERROR")
-                                    progress_callback(errors=1)
-                            
-                            pdf_token = pdf_res.get('nextPageToken')
-                        
-                        log_message(log_callback, "Flat folder processing complete.", "SUCCESS")
-                        return  # Exit early, no need to continue with folder structure
-                    else:
-                        # No PDFs and no folders found
-                        log_message(log_callback, "ABSOLUTELY NO ITEMS FOUND in this folder.", "CRITICAL")
-                        log_message(log_callback, "1. Confirm the Folder ID is correct.", "CRITICAL")
-                        log_message(log_callback, "2. Confirm you shared it with the Service Account Email.", "CRITICAL")
-                        return
-                except Exception as dbg_err:
-                    log_message(log_callback, f"Flat folder check failed: {dbg_err}", "ERROR")
-                    return
-            # --- FLAT FOLDER MODE END ---
+            with open(self.path, 'rb') as f:
+                data = orjson.loads(f.read())
+            # Files from before created_at was recorded count as expired
+            if self.started_at - data.get('created_at', 0) < FOLDER_CACHE_MAX_AGE_SECONDS:
+                self.children = data['children']
+                self.synced_at = data['synced_at']
+                self.created_at = data['created_at']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading folder cache: {e}")
+
+    def refresh(self, service, log_callback):
+        """Drops cached entries for folders changed since the last sync."""
+        if not self.children:
+            return
 
-            for item in items:
-                if stop_event.is_set():
+        # Allow for clock skew between this machine and Drive
+        since = datetime.datetime.fromtimestamp(self.synced_at - 600, datetime.timezone.utc)
+        query = f"mimeType = '{FOLDER_MIME_TYPE}' and modifiedTime > '{since.strftime('%Y-%m-%dT%H:%M:%S')}'"
+
+        changed_ids = set()
+        stale_ids = set()
+        page_token = None
+        try:
+            while True:
+                results = execute_request(service.files().list(
+                    q=query,
+                    pageSize=LIST_PAGE_SIZE,
+                    fields="nextPageToken, files(id, parents)",
+                    pageToken=page_token
+                ))
+                for item in results.get('files', []):
+                    changed_ids.add(item['id'])
+                    stale_ids.update(item.get('parents', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
                     break
+        except Exception as e:
+            log_message(log_callback, f"Folder cache refresh failed, relisting all folders: {e}", "WARNING")
+            self.children = {}
+            self.created_at = self.started_at
+            return
+
+        stale_ids |= changed_ids
+        for folder_id, items in self.children.items():
+            if any(item['id'] in changed_ids for item in items):
+                stale_ids.add(folder_id)
+        for folder_id in stale_ids:
+            self.children.pop(folder_id, None)
+        log_message(log_callback, f"Folder cache: {len(self.children)} folders reused.", "INFO")
+
+    def get(self, folder_id):
+        return self.children.get(folder_id)
+
+    def put(self, folder_id, items):
+        self.children[folder_id] = [{"id": item['id'], "name": item['name']} for item in items]
+
+    def save(self):
+        try:
+            with open(self.path, 'wb') as f:
+                f.write(orjson.dumps({
+                    "created_at": self.created_at,
+                    "synced_at": self.started_at,
+                    "children": self.children
+                }))
+        except Exception as e:
+            print(f"Error saving folder cache: {e}")
+
+def list_children(service, parent_ids, mime_type, log_callback, stop_event, on_items=None):
+    """
+    Lists the children of many folders at once. Folders are grouped into
+    OR-combined parent queries of up to PARENTS_PER_QUERY each, and those
+    queries (plus their follow-up pages) are sent together as batch requests.
+    Calls that fail transiently are retried in a later batch with backoff.
+    Returns {parent_id: [items sorted by name]}; folders whose listing failed
+    or was cut short by stop_event are left out, so an unlisted folder is
+    never mistaken for an empty one.
+
+    If `on_items` is given, each page of results is passed to
+    on_items(parent_id, items) as soon as it arrives instead of being collected.
+    """
+    children = {parent_id: [] for parent_id in parent_ids}
+    completed_ids = set()
+
+    # Outstanding list calls as (chunk_ids, query, page_token, attempt)
+    pending = []
+    for start in range(0, len(parent_ids), PARENTS_PER_QUERY):
+        chunk = parent_ids[start:start + PARENTS_PER_QUERY]
+        parents_clause = " or ".join(f"'{parent_id}' in parents" for parent_id in chunk)
+        query = f"({parents_clause}) and mimeType = '{mime_type}' and trashed = false"
+        pending.append((set(chunk), query, None, 0))
 
-                item_id = item['id']
-                item_name = item['name']
-                new_context = context_data.copy()
-                
-                if current_level < 5:
-                    # Recursive traversal
-                    levels = ["Academic Year", "Term", "Subject", "Book Type", "Release Year"]
-                    log_message(log_callback, f"Entering {levels[current_level]}: {item_name}", "INFO")
-                    
-                    id_keys = ['academic_year_id', 'term_id', 'subject_id', 'book_type_id', 'release_year']
-                    new_context[id_keys[current_level]] = item_name
-                    
-                    process_level(service, item_id, current_level + 1, new_context, processed_ids, log_callback, progress_callback, stop_event, config, output_file)
-                    
+    retry_delay = 0
+    while pending and not stop_event.is_set():
+        if retry_delay:
+            time.sleep(retry_delay)
+            retry_delay = 0
+        current, pending = pending[:MAX_BATCH_REQUESTS], pending[MAX_BATCH_REQUESTS:]
+
+        def on_list_response(request_id, response, exception):
+            nonlocal retry_delay
+            chunk_ids, query, page_token, attempt = current[int(request_id)]
+
+            if exception is not None:
+                if is_transient_error(exception) and attempt + 1 < RETRY_ATTEMPTS:
+                    pending.append((chunk_ids, query, page_token, attempt + 1))
+                    retry_delay = max(retry_delay, backoff_delay(attempt))
                 else:
-                    # File Processing
-                    if item_id in processed_ids:
-                        progress_callback(skipped=1)
-                        continue
-                    
-                    log_message(log_callback, f"Processing: {item_name}", "INFO")
-                    
-                    try:
-                        temp_pdf_path = download_file(service, item_id, item_name)
-                        meta = process_pdf(temp_pdf_path, item_id, item_name, log_callback)
-                        
-                        if os.path.exists(temp_pdf_path):
-                            os.remove(temp_pdf_path)
-                        
-                        if meta:
-                            record = {
-                                "name": item_name,
-                                "drive_file_id": item_id,
-                                **new_context,
-                                **meta
-                            }
-                            # Ensure we don't overwrite if manual config said "Direct" but we are deep scanning?
-                            # Actually recursive scan overwrites keys from folder names, which is desired.
-                            append_record(record, output_file)
-                            processed_ids.add(item_id)
-                            log_message(log_callback, f"Finished: {item_name}", "SUCCESS")
-                            progress_callback(processed=1)
-                        else:
-                            log_message(log_callback, f"Failed metadata extraction: {item_name}", "ERROR")
-                            progress_callback(errors=1)
-                            
-                    except Exception as exc:
-                        log_message(log_callback, f"Error on file {item_name}: {exc}", "ERROR")
-                        progress_callback(errors=1)
-
-            page_token = results.get('nextPageToken')
-            if not page_token:
-                break
-                
+                    log_message(log_callback, f"Listing error: {exception}", "ERROR")
+                return
+
+            page_children = {}
+            for item in response.get('files', []):
+                # Regroup under the folder of this chunk the item was found in
+                parent_id = next((p for p in item.get('parents', []) if p in chunk_ids), None)
+                if parent_id:
+                    page_children.setdefault(parent_id, []).append(item)
+            for parent_id, items in page_children.items():
+                if on_items:
+                    on_items(parent_id, items)
+                else:
+                    children[parent_id].extend(items)
+
+            next_page_token = response.get('nextPageToken')
+            if next_page_token:
+                pending.append((chunk_ids, query, next_page_token, 0))
+            else:
+                completed_ids.update(chunk_ids)
+
+        batch = service.new_batch_http_request(callback=on_list_response)
+        for idx, (_, query, page_token, _) in enumerate(current):
+            batch.add(
+                service.files().list(
+                    q=query,
+                    pageSize=LIST_PAGE_SIZE,
+                    fields="nextPageToken, files(id, name, parents, md5Checksum)",
+                    pageToken=page_token
+                ),
+                request_id=str(idx)
+            )
+
+        try:
+            execute_request(batch, calls=len(current))
+        except Exception as e:
+            log_message(log_callback, f"Listing error: {e}", "ERROR")
+
+    # Only folders whose query ran to its last page; failed calls and calls
+    # still pending when the scan was stopped are dropped
+    children = {parent_id: items for parent_id, items in children.items() if parent_id in completed_ids}
+    for items in children.values():
+        items.sort(key=itemgetter('name'))
+    return children
+
+def list_pdfs_tree_wide(service, parent_ids, log_callback, stop_event, on_items=None):
+    """
+    Lists every PDF visible to the service account with one paginated query
+    and keeps those that sit in one of `parent_ids`. Cheaper than per-folder
+    queries once the hierarchy has many release-year folders.
+    Returns {parent_id: [items sorted by name]}, or streams pages to
+    `on_items`, like list_children.
+    """
+    children = {parent_id: [] for parent_id in parent_ids}
+    query = f"mimeType = '{PDF_MIME_TYPE}' and trashed = false"
+
+    page_token = None
+    while not stop_event.is_set():
+        try:
+            results = execute_request(service.files().list(
+                q=query,
+                pageSize=LIST_PAGE_SIZE,
+                fields="nextPageToken, files(id, name, parents, md5Checksum)",
+                pageToken=page_token
+            ))
         except Exception as e:
-            log_message(log_callback, f"Level {current_level} error: {e}", "ERROR")
+            log_message(log_callback, f"Listing error: {e}", "ERROR")
+            break
+
+        for item in results.get('files', []):
+            parent_id = next((p for p in item.get('parents', []) if p in children), None)
+            if not parent_id:
+                continue
+            if on_items:
+                on_items(parent_id, [item])
+            else:
+                children[parent_id].append(item)
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
             break
 
+    for items in children.values():
+        items.sort(key=itemgetter('name'))
+    return children
+
+def iter_pdfs(service, parent_id, stop_event):
+    """Yields the PDFs directly inside a folder, following pagination with list_next."""
+    pdf_query = f"'{parent_id}' in parents and mimeType = '{PDF_MIME_TYPE}' and trashed = false"
+    request = service.files().list(
+        q=pdf_query,
+        pageSize=LIST_PAGE_SIZE,
+        fields="nextPageToken, files(id, name, md5Checksum)"
+    )
+    while request is not None and not stop_event.is_set():
+        response = execute_request(request)
+        yield from response.get('files', [])
+        request = service.files().list_next(request, response)
+
+def process_flat_folder(service, parent_id, pipeline, log_callback, stop_event, config):
+    """Handles a root folder that holds PDF files directly instead of the folder hierarchy."""
+    log_message(log_callback, "No folders found matching the structure. Checking for PDF files...", "INFO")
+
+    # Use metadata from config for flat folder
+    flat_context = {
+        "academic_year_id": config.get('academic_year_id', 'Direct'),
+        "term_id": config.get('term_id', 'Direct'),
+        "subject_id": config.get('subject_id', 'Direct'),
+        "book_type_id": config.get('book_type_id', 'Direct'),
+        "release_year": config.get('release_year', 'Direct'),
+    }
+
+    try:
+        pdf_count = 0
+        # Process PDFs directly without nested structure
+        for pdf_item in iter_pdfs(service, parent_id, stop_event):
+            if pdf_count == 0:
+                log_message(log_callback, "FLAT FOLDER MODE: Found PDF files. Processing...", "SUCCESS")
+            pdf_count += 1
+            pipeline.submit(pdf_item['id'], pdf_item['name'], flat_context, pdf_item.get('md5Checksum'))
+
+        if pdf_count:
+            log_message(log_callback, f"Flat folder listing complete: {pdf_count} PDF files.", "SUCCESS")
+        elif not stop_event.is_set():
+            # No PDFs and no folders found
+            log_message(log_callback, "ABSOLUTELY NO ITEMS FOUND in this folder.", "CRITICAL")
+            log_message(log_callback, "1. Confirm the Folder ID is correct.", "CRITICAL")
+            log_message(log_callback, "2. Confirm you shared it with the Service Account Email.", "CRITICAL")
+    except Exception as dbg_err:
+        log_message(log_callback, f"Flat folder check failed: {dbg_err}", "ERROR")
+
+def list_subfolders(service, folder_ids, folder_cache, log_callback, stop_event):
+    """
+    Returns {folder_id: [sub-folders]}, listing only the folders the cache
+    cannot answer for.
+    """
+    children = {}
+    to_list = []
+    for folder_id in folder_ids:
+        cached = folder_cache.get(folder_id)
+        if cached is None:
+            to_list.append(folder_id)
+        else:
+            children[folder_id] = cached
+
+    if to_list:
+        listed = list_children(service, to_list, FOLDER_MIME_TYPE, log_callback, stop_event)
+        # Don't cache a listing that was interrupted by Stop
+        if not stop_event.is_set():
+            for folder_id, items in listed.items():
+                folder_cache.put(folder_id, items)
+        children.update(listed)
+    return children
+
+def process_tree(service, root_id, pipeline, folder_cache, log_callback, stop_event, config):
+    """
+    Walks the folder hierarchy breadth-first. All folders of one level are
+    taken off the frontier together so their children can be listed with
+    batched queries; PDFs found at the file level go straight to the pipeline.
+    The folder skeleton (levels 0-4) is served from FolderCache where unchanged.
+    """
+    # Levels: 0:Year -> 1:Term -> 2:Subject -> 3:Type -> 4:Release -> 5:Files
+    levels = ["Academic Year", "Term", "Subject", "Book Type", "Release Year"]
+    id_keys = ['academic_year_id', 'term_id', 'subject_id', 'book_type_id', 'release_year']
+
+    folder_cache.refresh(service, log_callback)
+    # Each frontier entry carries the folder names on its path as a tuple
+    # (one per level above it); the context dict is only built at the file level
+    frontier = deque([(root_id, 0, ())])
+    try:
+        while frontier and not stop_event.is_set():
+            current_level = frontier[0][1]
+            nodes = []
+            while frontier and frontier[0][1] == current_level:
+                folder_id, _, path_names = frontier.popleft()
+                nodes.append((folder_id, path_names))
+
+            folder_ids = [folder_id for folder_id, _ in nodes]
+            if current_level == 5:
+                # File Processing: PDFs go to the download/render/upload pipeline
+                # page by page as the listing comes in, so processing starts
+                # before every release-year folder has been listed.
+                # Folder names override the "Direct" config defaults, which is desired.
+                contexts = {folder_id: dict(zip(id_keys, path_names)) for folder_id, path_names in nodes}
+
+                def submit_pdfs(folder_id, items):
+                    for item in items:
+                        pipeline.submit(item['id'], item['name'], contexts[folder_id], item.get('md5Checksum'))
+
+                if len(folder_ids) >= TREE_WIDE_PDF_LISTING_MIN_FOLDERS:
+                    list_pdfs_tree_wide(service, folder_ids, log_callback, stop_event, on_items=submit_pdfs)
+                else:
+                    list_children(service, folder_ids, PDF_MIME_TYPE, log_callback, stop_event, on_items=submit_pdfs)
+                continue
+
+            children = list_subfolders(service, folder_ids, folder_cache, log_callback, stop_event)
+            if stop_event.is_set():
+                return
+
+            if current_level == 0 and root_id not in children:
+                # list_children has already logged the listing error; without the
+                # root's children there is no way to tell a hierarchy from a flat folder
+                log_message(log_callback, "Could not list the root folder, stopping scan.", "CRITICAL")
+                return
+
+            # --- FLAT FOLDER MODE ---
+            if current_level == 0 and not children[root_id]:
+                process_flat_folder(service, root_id, pipeline, log_callback, stop_event, config)
+                return
+
+            for folder_id, path_names in nodes:
+                for item in children.get(folder_id, []):
+                    if stop_event.is_set():
+                        return
+                    log_message(log_callback, f"Entering {levels[current_level]}: {item['name']}", "INFO")
+                    frontier.append((item['id'], current_level + 1, path_names + (item['name'],)))
+    finally:
+        folder_cache.save()
+
 def start_scan_job(config, log_callback, progress_callback, stop_event, set_meta_info_callback=None):
     """
     Entry point for the background thread.
@@ -395,7 +977,8 @@ def start_scan_job(config, log_callback, progress_callback, stop_event, set_meta
     # Setup Google Drive
     service = None
     try:
-        service = get_drive_service(config.get('service_account_json'))
+        creds = get_credentials(config.get('service_account_json'))
+        service = get_drive_service(creds)
         log_message(log_callback, "Google Drive Authenticated.", "SUCCESS")
     except Exception as e:
         log_message(log_callback, f"Google Drive Auth Error: {e}", "CRITICAL")
@@ -407,9 +990,11 @@ def start_scan_job(config, log_callback, progress_callback, stop_event, set_meta
     output_filename = "books.json"
 
     try:
+        folder_meta = execute_request(service.files().get(fileId=root_id, fields="id, name"))
         if root_id != 'root':
-            folder_meta = service.files().get(fileId=root_id, fields="name").execute()
             folder_name = folder_meta.get('name', 'unknown_folder')
+        # Resolve the 'root' alias so the folder cache is keyed by real IDs
+        root_id = folder_meta.get('id', root_id)
         
         # Sanitize folder name for filename
         safe_name = sanitize_filename(folder_name)
@@ -428,6 +1013,18 @@ def start_scan_job(config, log_callback, progress_callback, stop_event, set_meta
     processed_ids = load_processed_ids(output_filename)
     log_message(log_callback, f"Loaded {len(processed_ids)} previously processed files.", "INFO")
     
-    process_level(service, root_id, 0, {}, processed_ids, log_callback, progress_callback, stop_event, config, output_filename)
+    pipeline = FilePipeline(
+        creds,
+        processed_ids,
+        output_filename,
+        log_callback,
+        progress_callback,
+        stop_event
+    )
+    try:
+        folder_cache = FolderCache(creds.service_account_email)
+        process_tree(service, root_id, pipeline, folder_cache, log_callback, stop_event, config)
+    finally:
+        pipeline.close()
     
     log_message(log_callback, "Scan job finished.", "SUCCESS")